@@ -1,9 +1,11 @@
 import os
+import time
 import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -13,9 +15,39 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 
+def calibrate_password_hash(target_ms, min_log2_n=15, max_log2_n=16):
+    """
+    Pick the largest scrypt cost hashing within target_ms on this host,
+    never going below werkzeug's default (N=2**15). scrypt needs 128 * r * N
+    bytes per hash, so the N=2**16 ceiling keeps each login at 64 MiB
+    """
+    method = f"scrypt:{1 << min_log2_n}:8:1"
+    for log2_n in range(min_log2_n + 1, max_log2_n + 1):
+        candidate = f"scrypt:{1 << log2_n}:8:1"
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            generate_password_hash("calibration", method=candidate)
+            timings.append((time.perf_counter() - start) * 1000)
+        if min(timings) > target_ms:
+            break
+        method = candidate
+    logging.info("Using password hash method %s", method)
+    return method
+
 # Create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
+# Key for payment PIN HMACs (changing it invalidates existing PINs)
+app.config["PIN_HMAC_KEY"] = os.environ.get("PIN_HMAC_KEY")
+if not app.config["PIN_HMAC_KEY"]:
+    logging.warning("PIN_HMAC_KEY is not set; payment PINs are keyed with the session secret, "
+                    "so rotating it invalidates every PIN. Set a dedicated secret key in production")
+    app.config["PIN_HMAC_KEY"] = app.secret_key
+# Password hash cost, calibrated on the first password set unless pinned
+# (existing hashes keep their own cost)
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD")
+app.config["PASSWORD_HASH_TARGET_MS"] = float(os.environ.get("PASSWORD_HASH_TARGET_MS", "100"))
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database
@@ -29,6 +61,16 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 app.config['UPLOAD_FOLDER'] = 'palm_images'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Use CUDA for palm preprocessing, ORB and matching when available
+# (palms must be re-enrolled after toggling, CUDA ORB descriptors differ)
+app.config['PALM_USE_GPU'] = os.environ.get("PALM_USE_GPU", "0") == "1"
+
+# Use OpenCL (e.g. integrated GPUs) for palm preprocessing when CUDA is not in use
+app.config['PALM_USE_OPENCL'] = os.environ.get("PALM_USE_OPENCL", "0") == "1"
+
+# Compute palm Hamming distances with BLAS (faster than popcount on multi-core hosts)
+app.config['PALM_USE_BLAS'] = os.environ.get("PALM_USE_BLAS", "0") == "1"
+
 # Initialize the app with the extension
 db.init_app(app)
 
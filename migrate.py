@@ -0,0 +1,105 @@
+"""
+Schema migrations for databases created before a schema change.
+
+db.create_all() only creates missing tables, so existing databases must be
+brought up to date before the app serves requests (the .replit run commands
+do this before starting gunicorn). Every step is idempotent:
+
+    python migrate.py
+"""
+import json
+import logging
+import numpy as np
+from sqlalchemy import inspect, text
+from app import app, db
+from models import User, Transaction, PalmScanLog
+
+
+def add_column(table: str, name: str, column_type):
+    """
+    Add a column to an existing table if it is missing
+    """
+    if name in [c['name'] for c in inspect(db.engine).get_columns(table)]:
+        return
+    type_sql = column_type.compile(dialect=db.engine.dialect)
+    db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {name} {type_sql}'))
+    db.session.commit()
+    logging.info(f"Added column {table}.{name}")
+
+
+def migrate_palm_features():
+    """
+    Convert JSON-encoded palm descriptors to raw uint8 bytes
+    """
+    column = next(c for c in inspect(db.engine).get_columns('user') if c['name'] == 'palm_features')
+    if db.engine.dialect.name == 'postgresql' and column['type'].python_type is str:
+        db.session.execute(text(
+            'ALTER TABLE "user" ALTER COLUMN palm_features TYPE BYTEA '
+            "USING convert_to(palm_features, 'UTF8')"
+        ))
+    
+    rows = db.session.execute(text(
+        'SELECT id, palm_features FROM "user" WHERE palm_features IS NOT NULL'
+    )).all()
+    
+    converted = 0
+    for user_id, value in rows:
+        if isinstance(value, (bytes, memoryview)):
+            try:
+                value = bytes(value).decode('utf-8')
+            except UnicodeDecodeError:
+                continue  # Already raw descriptor bytes
+        try:
+            descriptors = np.array(json.loads(value), dtype=np.uint8)
+        except ValueError:
+            continue
+        
+        db.session.execute(
+            text('UPDATE "user" SET palm_features = :features WHERE id = :id'),
+            {'features': descriptors.tobytes(), 'id': user_id}
+        )
+        converted += 1
+    
+    db.session.commit()
+    logging.info(f"Converted palm features of {converted} users to binary")
+
+
+def add_missing_columns():
+    """
+    Add columns introduced after the tables were first created.
+    Runs before any ORM query, which selects every mapped column
+    """
+    add_column('user', 'palm_hash', db.LargeBinary())
+    add_column('user', 'pin_failed_attempts', db.Integer())
+    add_column('user', 'pin_locked_until', db.DateTime())
+    add_column('user', 'palm_version', db.Integer())
+
+
+def create_missing_indexes():
+    """
+    Create indexes added to tables that already exist
+    """
+    for table in (User.__table__, Transaction.__table__, PalmScanLog.__table__):
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    logging.info("Created missing indexes")
+
+
+def migrate_palm_hash():
+    """
+    Compute the palm hash for already enrolled users
+    """
+    users = User.query.filter(User.palm_features.isnot(None), User.palm_hash.is_(None)).all()
+    for user in users:
+        user.set_palm_descriptors(user.get_palm_descriptors())
+    
+    db.session.commit()
+    logging.info(f"Computed palm hash for {len(users)} users")
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        migrate_palm_features()
+        add_missing_columns()
+        create_missing_indexes()
+        migrate_palm_hash()
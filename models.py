@@ -1,15 +1,40 @@
-from app import db
-from datetime import datetime
+from app import app, db, calibrate_password_hash
+from datetime import datetime, timedelta
+import hashlib
+import hmac
+import secrets
+import numpy as np
+from palm_hashing import palm_hash
+from sqlalchemy import case, func, update
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# Failed PIN attempts allowed before the PIN is locked, and for how long
+PIN_MAX_ATTEMPTS = 5
+PIN_LOCKOUT = timedelta(minutes=5)
+
+def pin_digest(salt, pin):
+    """Keyed HMAC-SHA256 of a payment PIN"""
+    key = app.config['PIN_HMAC_KEY'].encode()
+    return hmac.new(key, f"{salt}${pin}".encode(), hashlib.sha256).hexdigest()
+
+def password_hash_method():
+    """scrypt method for new password hashes, calibrated once per process on first use"""
+    if not app.config['PASSWORD_HASH_METHOD']:
+        app.config['PASSWORD_HASH_METHOD'] = calibrate_password_hash(app.config['PASSWORD_HASH_TARGET_MS'])
+    return app.config['PASSWORD_HASH_METHOD']
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
     palm_image_path = db.Column(db.String(255))
-    palm_features = db.Column(db.Text)  # Store ORB features as JSON string
+    palm_features = db.Column(db.LargeBinary)  # Store ORB descriptors as raw uint8 bytes
+    palm_hash = db.Column(db.LargeBinary)  # 256-bit aggregate of the descriptors for the opt-in 1:N shortlist
+    palm_version = db.Column(db.Integer, default=0)  # Bumped on every enrollment, lets every worker detect a stale palm gallery
     payment_pin_hash = db.Column(db.String(256))  # 6-digit PIN for backup authentication
+    pin_failed_attempts = db.Column(db.Integer, default=0)
+    pin_locked_until = db.Column(db.DateTime)
     wallet_balance = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_palm_registered = db.Column(db.Boolean, default=False)
@@ -20,53 +45,125 @@ class User(db.Model):
     transactions_received = db.relationship('Transaction', foreign_keys='Transaction.receiver_id', backref='receiver', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=password_hash_method())
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
+    def set_palm_descriptors(self, descriptors):
+        """Store ORB descriptors as raw uint8 bytes"""
+        self.palm_features = np.ascontiguousarray(descriptors, dtype=np.uint8).tobytes()
+        self.palm_hash = palm_hash(descriptors).tobytes()
+        self.palm_version = func.coalesce(User.palm_version, 0) + 1  # Incremented by the UPDATE itself
+    
+    def get_palm_descriptors(self):
+        """Load stored ORB descriptors as an (N, 32) uint8 array"""
+        if not self.palm_features:
+            return None
+        return np.frombuffer(self.palm_features, dtype=np.uint8).reshape(-1, 32)
+    
     def set_payment_pin(self, pin):
         """Set 6-digit payment PIN"""
         if len(pin) == 6 and pin.isdigit():
-            self.payment_pin_hash = generate_password_hash(pin)
+            salt = secrets.token_hex(8)
+            self.payment_pin_hash = f"hmac-sha256${salt}${pin_digest(salt, pin)}"
+            self.pin_failed_attempts = 0
+            self.pin_locked_until = None
             self.is_pin_set = True
             return True
         return False
     
+    def is_pin_locked(self):
+        """Whether PIN entry is locked after too many failed attempts"""
+        return self.pin_locked_until is not None and self.pin_locked_until > datetime.utcnow()
+    
     def check_payment_pin(self, pin):
-        """Verify 6-digit payment PIN"""
-        if not self.payment_pin_hash:
+        """Verify 6-digit payment PIN, locking it after repeated failures"""
+        if not self.payment_pin_hash or self.is_pin_locked():
             return False
-        return check_password_hash(self.payment_pin_hash, pin)
-    
-    def add_funds(self, amount):
-        self.wallet_balance += amount
-        db.session.commit()
-    
-    def deduct_funds(self, amount):
-        if self.wallet_balance >= amount:
-            self.wallet_balance -= amount
-            db.session.commit()
-            return True
-        return False
+        
+        if self.payment_pin_hash.startswith('hmac-sha256$'):
+            _, salt, digest = self.payment_pin_hash.split('$')
+            is_valid = hmac.compare_digest(pin_digest(salt, pin), digest)
+        else:
+            # PINs set before the switch to HMAC, upgraded once verified
+            is_valid = check_password_hash(self.payment_pin_hash, pin)
+            if is_valid:
+                self.set_payment_pin(pin)
+        
+        if is_valid:
+            self.pin_failed_attempts = 0
+            self.pin_locked_until = None
+        else:
+            # Count the failure in the database, so concurrent wrong PINs cannot
+            # overwrite each other's count; the caller commits
+            attempts = func.coalesce(User.pin_failed_attempts, 0) + 1
+            db.session.execute(
+                update(User)
+                .where(User.id == self.id)
+                .values(
+                    pin_failed_attempts=case((attempts >= PIN_MAX_ATTEMPTS, 0), else_=attempts),
+                    pin_locked_until=case(
+                        (attempts >= PIN_MAX_ATTEMPTS, datetime.utcnow() + PIN_LOCKOUT),
+                        else_=User.pin_locked_until
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.session.expire(self, ['pin_failed_attempts', 'pin_locked_until'])
+        return is_valid
     
     def __repr__(self):
         return f'<User {self.username}>'
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_tx_sender_ts', 'sender_id', 'timestamp'),
+        db.Index('ix_tx_receiver_ts', 'receiver_id', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # None for deposits
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)  # 'deposit', 'payment', 'withdrawal'
     description = db.Column(db.String(255))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     status = db.Column(db.String(20), default='completed')  # 'pending', 'completed', 'failed'
     
+    @classmethod
+    def for_user(cls, user_id, limit=None):
+        """
+        Newest-first transactions sent or received by a user. Runs as a UNION ALL
+        of a sender and a receiver branch so each one is an index range scan
+        (an OR filter with ORDER BY falls back to a full scan and sort)
+        """
+        # Withdrawals are recorded with sender == receiver, keep them in the sender branch only
+        conditions = (
+            (cls.sender_id == user_id,),
+            (cls.receiver_id == user_id, cls.sender_id.is_distinct_from(user_id)),
+        )
+        branches = []
+        for condition in conditions:
+            branch = db.select(cls).where(*condition).order_by(cls.timestamp.desc())
+            if limit is not None:
+                branch = branch.limit(limit)
+            branches.append(db.select(branch.subquery()))
+        
+        merged = db.aliased(cls, db.union_all(*branches).subquery())
+        query = db.select(merged).order_by(merged.timestamp.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return db.session.execute(query).scalars().all()
+    
     def __repr__(self):
         return f'<Transaction {self.id}: {self.transaction_type} - ${self.amount}>'
 
 class PalmScanLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_scan_user_ts', 'user_id', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     scan_result = db.Column(db.String(20), nullable=False)  # 'success', 'failed', 'no_match'
@@ -0,0 +1,160 @@
+import logging
+import threading
+import numpy as np
+from typing import List, Tuple
+from sqlalchemy import func
+from app import db
+from models import User
+from palm_hashing import palm_hash, hash_distances
+from palm_recognition import PalmRecognition, HASH_PREFILTER_MIN_USERS, HASH_PREFILTER_CANDIDATES
+
+
+def enrolled_palms():
+    """
+    Filter selecting users with a stored palm template
+    """
+    return (User.is_palm_registered.is_(True), User.palm_features.isnot(None))
+
+
+class PalmDatabase:
+    """
+    In-process gallery of every enrolled palm, packed into one contiguous
+    (K, max_features, 32) uint8 tensor for 1:N identification.
+    
+    Each worker process keeps its own copy, tagged with a stamp of
+    (enrolled users, sum of their palm versions). Every enrollment bumps a
+    version by exactly one, so a tiny aggregate query per lookup detects
+    enrollments made by other workers.
+    """
+    
+    def __init__(self, recognizer: PalmRecognition):
+        self.logger = logging.getLogger(__name__)
+        self.recognizer = recognizer
+        self._lock = threading.Lock()
+        self._gallery = None
+        self._stamp = None
+    
+    def current_stamp(self) -> Tuple[int, int]:
+        """
+        Read the gallery stamp from the database without fetching any template
+        """
+        count, versions = db.session.query(
+            func.count(User.id), func.coalesce(func.sum(func.coalesce(User.palm_version, 0)), 0)
+        ).filter(*enrolled_palms()).one()
+        return int(count), int(versions)
+    
+    def load(self) -> Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], Tuple[int, int]]:
+        """
+        Decode every enrolled user's descriptors once into a padded tensor.
+        Returns ((user_ids, descriptors, lengths, hashes), stamp)
+        """
+        # Fetch only the packed palm columns, not full User rows
+        rows = db.session.query(User.id, User.palm_features, User.palm_hash, User.palm_version).filter(
+            *enrolled_palms()
+        ).all()
+        stamp = (len(rows), sum(row.palm_version or 0 for row in rows))
+        
+        enrolled = []
+        hashes = []
+        for user_id, features_blob, hash_blob, _ in rows:
+            descriptors = np.frombuffer(features_blob, dtype=np.uint8).reshape(-1, 32)
+            if len(descriptors) > 0:
+                enrolled.append((user_id, descriptors))
+                hashes.append(np.frombuffer(hash_blob, dtype=np.uint8) if hash_blob else palm_hash(descriptors))
+        
+        max_features = max((len(descriptors) for _, descriptors in enrolled), default=0)
+        user_ids = np.array([user_id for user_id, _ in enrolled], dtype=np.int64)
+        lengths = np.array([len(descriptors) for _, descriptors in enrolled], dtype=np.int32)
+        gallery = np.zeros((len(enrolled), max_features, 32), dtype=np.uint8)
+        for k, (_, descriptors) in enumerate(enrolled):
+            gallery[k, :len(descriptors)] = descriptors
+        
+        hashes = np.array(hashes, dtype=np.uint8).reshape(-1, 32)
+        
+        self.logger.info("Loaded palm gallery with %d users", len(enrolled))
+        return (user_ids, gallery, lengths, hashes), stamp
+    
+    def get_gallery(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return the cached gallery, (re)loading it on first use or once
+        another worker has changed the enrolled palms
+        """
+        stamp = self.current_stamp()
+        with self._lock:
+            if self._gallery is None or self._stamp != stamp:
+                self._gallery, self._stamp = self.load()
+            return self._gallery
+    
+    def enroll(self, user_id: int, descriptors: np.ndarray):
+        """
+        Add or replace one user's palm in the cached gallery (after the
+        enrollment is committed) without reloading every enrolled user
+        """
+        descriptors = np.ascontiguousarray(descriptors, dtype=np.uint8).reshape(-1, 32)
+        with self._lock:
+            if self._gallery is None:
+                return  # The next load picks the new palm up from the database
+            
+            user_ids, gallery, lengths, hashes = self._gallery
+            keep = user_ids != user_id
+            
+            # Stamp the database should now report: this enrollment added exactly
+            # one version. Any other enrollment since the gallery was stamped makes
+            # the database stamp differ, which triggers a full reload
+            count, versions = self._stamp
+            self._stamp = (count + int(keep.all()), versions + 1)
+            
+            user_ids, gallery, lengths, hashes = user_ids[keep], gallery[keep], lengths[keep], hashes[keep]
+            
+            # Build new arrays so searches holding the previous gallery are unaffected
+            max_features = max(gallery.shape[1], len(descriptors))
+            grown = np.zeros((len(user_ids) + 1, max_features, 32), dtype=np.uint8)
+            grown[:-1, :gallery.shape[1]] = gallery
+            grown[-1, :len(descriptors)] = descriptors
+            
+            self._gallery = (
+                np.concatenate([user_ids, np.array([user_id], dtype=np.int64)]),
+                grown,
+                np.concatenate([lengths, np.array([len(descriptors)], dtype=np.int32)]),
+                np.vstack([hashes, palm_hash(descriptors)])
+            )
+    
+    def identify(self, test_features: np.ndarray, top_k: int = 1,
+                 shortlist: bool = False) -> List[Tuple[int, float]]:
+        """
+        Match already extracted palm features against every enrolled user.
+        With shortlist=True, large galleries are first narrowed by palm hash;
+        the shortlist can miss the true user, so logins and payments never use it.
+        Returns up to top_k (user_id, similarity) pairs, best first
+        """
+        user_ids, gallery, lengths, hashes = self.get_gallery()
+        if len(user_ids) == 0:
+            return []
+        
+        # Opt-in approximate search: shortlist by palm hash before full descriptor matching
+        if shortlist and len(user_ids) > max(HASH_PREFILTER_MIN_USERS, HASH_PREFILTER_CANDIDATES):
+            candidates = np.argpartition(
+                hash_distances(palm_hash(test_features), hashes), HASH_PREFILTER_CANDIDATES
+            )[:HASH_PREFILTER_CANDIDATES]
+            user_ids, gallery, lengths = user_ids[candidates], gallery[candidates], lengths[candidates]
+        
+        scores = self.recognizer.compare_many(test_features, gallery, lengths)
+        best = np.argsort(scores)[::-1][:top_k]
+        return [(int(user_ids[k]), float(scores[k])) for k in best]
+    
+    def authenticate_palm_1toN(self, test_image_path: str, top_k: int = 1,
+                               shortlist: bool = False) -> List[Tuple[int, float]]:
+        """
+        Identify a palm image against every enrolled user.
+        Returns up to top_k (user_id, similarity) pairs, best first
+        """
+        try:
+            test_features = self.recognizer.extract_features(test_image_path)
+            if test_features is None:
+                return []
+            
+            return self.identify(test_features, top_k, shortlist)
+            
+        except Exception as e:
+            self.logger.error("Error during 1:N palm identification: %s", e)
+            return []
@@ -0,0 +1,20 @@
+import numpy as np
+
+# Palm hash helpers, kept free of OpenCV so models can use them without
+# loading the image pipeline
+
+
+def palm_hash(descriptors: np.ndarray) -> np.ndarray:
+    """
+    Aggregate a set of ORB descriptors into one 256-bit palm hash by
+    per-bit majority vote, used to shortlist candidates in 1:N lookup
+    """
+    bits = np.unpackbits(np.asarray(descriptors, dtype=np.uint8), axis=1)
+    return np.packbits(bits.mean(axis=0) > 0.5)
+
+
+def hash_distances(query_hash: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """
+    Hamming distance from one palm hash to each row of a (K, 32) hash matrix
+    """
+    return np.bitwise_count(np.bitwise_xor(hashes, query_hash[None, :])).sum(axis=1, dtype=np.int32)
@@ -1,53 +1,269 @@
 import cv2
 import numpy as np
-import json
 import logging
 from typing import Optional, Tuple
 
+# ORB detector settings shared by the CPU and CUDA extraction paths
+ORB_PARAMS = dict(nfeatures=250, scaleFactor=1.3, nlevels=4, scoreType=cv2.ORB_FAST_SCORE)
+
+# (width, height) every palm image is resized to before filtering and ORB,
+# which bounds extraction cost regardless of the upload resolution
+PALM_IMAGE_SIZE = (640, 480)
+
+# Leading bytes of every JPEG file (SOI marker)
+JPEG_MAGIC = b'\xff\xd8'
+
+# Minimum number of ORB features for an image to be usable for enrollment
+MIN_PALM_FEATURES = 10
+
+# uint64 words per XOR/popcount temporary in hamming_matrix (1 MB, stays in cache)
+HAMMING_TILE_WORDS = 1 << 17
+
+# Enrolled users matched per kernel pass in 1:N mode, bounds the distance tensor size
+GALLERY_BLOCK_USERS = 8
+
+# Opt-in 1:N shortlist by palm hash, applied only above this many enrolled users
+HASH_PREFILTER_MIN_USERS = 256
+HASH_PREFILTER_CANDIDATES = 64
+
+
+def hamming_matrix(features1: np.ndarray, features2: np.ndarray) -> np.ndarray:
+    """
+    Compute the full (N, M) Hamming distance matrix between two sets of
+    binary ORB descriptors
+    """
+    # Treat each 32-byte descriptor as four 64-bit words so NumPy's
+    # popcount runs on whole words (hardware POPCNT / VPOPCNTQ)
+    words1 = np.ascontiguousarray(features1).view(np.uint64)
+    words2 = np.ascontiguousarray(features2).view(np.uint64).T.copy()
+    
+    distances = np.zeros((words1.shape[0], words2.shape[1]), dtype=np.int32)
+    block_rows = max(1, HAMMING_TILE_WORDS // max(1, words2.shape[1]))
+    for start in range(0, words1.shape[0], block_rows):
+        block = distances[start:start + block_rows]
+        for word in range(words1.shape[1]):
+            block += np.bitwise_count(np.bitwise_xor(words1[start:start + block_rows, word, None], words2[word][None, :]))
+    return distances
+
+
+# -1/+1 float encoding of every byte value, MSB first (same bit order as np.unpackbits)
+SIGN_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) * 2 - 1
+
+
+def sign_vectors(descriptors: np.ndarray) -> np.ndarray:
+    """
+    Encode binary descriptors as (N, bits) -1/+1 float32 rows with one table
+    gather, instead of unpacking, casting and rescaling on every compare
+    """
+    return np.take(SIGN_TABLE, descriptors, axis=0).reshape(len(descriptors), -1)
+
+
+def hamming_matrix_blas(features1: np.ndarray, features2: np.ndarray) -> np.ndarray:
+    """
+    Compute the (N, M) Hamming distance matrix as a BLAS matrix product.
+    Bits are mapped to -1/+1, so for 256-bit descriptors
+    hamming = (256 - dot) / 2 and the whole matrix is one sgemm call
+    """
+    signs1 = sign_vectors(np.ascontiguousarray(features1, dtype=np.uint8))
+    signs2 = sign_vectors(np.ascontiguousarray(features2, dtype=np.uint8))
+    
+    # C-contiguous float32 operands, so np.dot hands them straight to sgemm;
+    # rescale in place rather than allocating two more (N, M) temporaries
+    dot = np.dot(signs1, signs2.T)
+    dot -= signs1.shape[1]
+    dot *= -0.5
+    return dot.astype(np.int32)
+
+
+def mutual_match_distances(distance_matrix: np.ndarray) -> np.ndarray:
+    """
+    Cross-check a Hamming distance matrix and return the distances of
+    mutual nearest-neighbour matches (equivalent to BFMatcher crossCheck)
+    """
+    best_in_2 = distance_matrix.argmin(axis=1)
+    best_in_1 = distance_matrix.argmin(axis=0)
+    mutual = np.flatnonzero(best_in_1[best_in_2] == np.arange(len(best_in_2)))
+    return distance_matrix[mutual, best_in_2[mutual]]
+
+
+def score_distances(distances: np.ndarray, min_features: int) -> float:
+    """
+    Turn the distances of cross-checked matches into a 0-1 similarity score
+    """
+    if len(distances) == 0:
+        return 0.0
+    
+    # Use more lenient distance threshold for better matching
+    good_matches = np.count_nonzero(distances < 60)  # Increased from 50 to 60
+    
+    # Use top 20% of matches (lowest distances) for more reliable scoring;
+    # only their count and mean are needed, so an O(N) partition replaces a sort
+    top_count = max(10, len(distances) // 5)
+    if top_count < len(distances):
+        top_distances = np.partition(distances, top_count - 1)[:top_count]
+    else:
+        top_distances = distances
+    excellent_matches = np.count_nonzero(top_distances < 45)
+    
+    # Calculate multiple similarity metrics
+    # 1. Ratio of good matches to minimum feature count
+    basic_score = good_matches / min_features
+    
+    # 2. Quality-weighted score based on match distances
+    avg_distance = float(top_distances.mean())
+    distance_score = max(0, (80 - avg_distance) / 80)  # Normalize distance to 0-1
+    
+    # 3. Excellent matches bonus
+    excellent_ratio = excellent_matches / min(20, min_features)
+    
+    # Combine scores with weights
+    final_score = (basic_score * 0.4) + (distance_score * 0.4) + (excellent_ratio * 0.2)
+    
+    # Cap the score at 1.0
+    final_score = min(1.0, float(final_score))
+    
+    logging.debug("Feature comparison: %d good matches, %d excellent matches out of %d total",
+                  good_matches, excellent_matches, len(distances))
+    logging.debug("Scores - Basic: %.3f, Distance: %.3f, Excellent: %.3f, Final: %.3f",
+                  basic_score, distance_score, excellent_ratio, final_score)
+    
+    return final_score
+
+
+def decode_grayscale_buffer(buffer: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Decode an encoded image buffer to grayscale, at half resolution for large JPEGs
+    """
+    # Only JPEG decodes faster at reduced size (it scales inside the IDCT); other
+    # formats such as the camera client's PNG captures are decoded once at full size
+    if buffer[:2].tobytes() != JPEG_MAGIC:
+        return cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+    
+    # Preprocessing resizes to PALM_IMAGE_SIZE anyway
+    width, height = PALM_IMAGE_SIZE
+    gray = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if gray is not None and (gray.shape[0] * 4 < height * 3 or gray.shape[1] * 4 < width * 3):
+        # Half resolution would need more than 4/3 upscaling, decode at full resolution
+        gray = cv2.imdecode(buffer, cv2.IMREAD_GRAYSCALE)
+    return gray
+
+
+def cuda_available() -> bool:
+    """
+    Check whether OpenCV was built with CUDA and a device is present
+    """
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
 class PalmRecognition:
-    def __init__(self):
-        """Initialize ORB feature detector for palm recognition"""
-        self.orb = cv2.ORB_create(nfeatures=1000, scaleFactor=1.2, nlevels=8)
-        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    def __init__(self, use_gpu: bool = False, use_opencl: bool = False, use_blas: bool = False):
+        """
+        Initialize ORB feature detector for palm recognition.
+        
+        With use_gpu, preprocessing, ORB and matching run on CUDA. CUDA ORB
+        descriptors differ from CPU ORB, so palms enrolled on one path must be
+        authenticated on the same path. Without CUDA, use_opencl runs the
+        preprocessing filters through OpenCV's OpenCL T-API (cv2.UMat).
+        use_blas computes CPU Hamming distances as a -1/+1 matrix product,
+        which pays off when BLAS can use several cores.
+        """
+        self.orb = cv2.ORB_create(**ORB_PARAMS)
+        
+        # Sharpening kernel pre-blended with identity (0.7 * original + 0.3 * sharpened)
+        # so the sharpen and blend steps run as a single filter2D pass
+        sharpen = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+        identity = np.zeros((3, 3), dtype=np.float32)
+        identity[1, 1] = 1.0
+        self.sharpen_kernel = 0.7 * identity + 0.3 * sharpen
+        
+        # Optional CUDA pipeline, used only when a device is available
+        self.use_gpu = use_gpu and cuda_available()
+        if self.use_gpu:
+            self.gpu_matcher = cv2.cuda.DescriptorMatcher_createBFMatcher(cv2.NORM_HAMMING)
+        elif use_gpu:
+            logging.warning("CUDA requested for palm matching but no device is available, using CPU")
+        
+        # CPU Hamming kernel: popcount by default, BLAS matrix product if requested
+        self.hamming = hamming_matrix_blas if use_blas else hamming_matrix
+        
+        # Optional OpenCL preprocessing for iGPUs and non-CUDA devices
+        self.use_opencl = use_opencl and not self.use_gpu and cv2.ocl.haveOpenCL()
+        if use_opencl and not self.use_gpu and not self.use_opencl:
+            logging.warning("OpenCL requested for palm preprocessing but no device is available, using CPU")
         
+    def load_grayscale(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Read palm image from disk as a grayscale array
+        """
+        try:
+            buffer = np.fromfile(image_path, dtype=np.uint8)
+        except OSError:
+            buffer = np.empty(0, dtype=np.uint8)
+        
+        gray = decode_grayscale_buffer(buffer) if buffer.size else None
+        if gray is None:
+            logging.error("Failed to load image: %s", image_path)
+            return None
+        
+        return gray
+    
+    def decode_grayscale(self, image_bytes: bytes) -> Optional[np.ndarray]:
+        """
+        Decode an uploaded palm image from memory as a grayscale array
+        """
+        if not image_bytes:
+            logging.error("Failed to decode image: empty upload")
+            return None
+        
+        buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+        gray = decode_grayscale_buffer(buffer)
+        if gray is None:
+            logging.error("Failed to decode image: %d bytes", len(image_bytes))
+            return None
+        
+        return gray
+    
+    def preprocess_fused(self, gray: np.ndarray) -> np.ndarray:
+        """
+        Run the preprocessing chain on a grayscale image, ping-ponging between
+        two PALM_IMAGE_SIZE buffers instead of allocating one per stage
+        """
+        # With OpenCL every filter below dispatches to the device transparently
+        if self.use_opencl:
+            gray = cv2.UMat(gray)
+        
+        # Resize to standard size first so every filter runs on PALM_IMAGE_SIZE
+        buffer = cv2.resize(gray, PALM_IMAGE_SIZE)
+        
+        # Apply bilateral filter to reduce noise while preserving edges
+        final = cv2.bilateralFilter(buffer, 9, 75, 75)
+        
+        # Enhance contrast using adaptive histogram equalization
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        clahe.apply(final, dst=buffer)
+        
+        # Sharpen palm lines and blend with the enhanced image in one pass
+        cv2.filter2D(buffer, -1, self.sharpen_kernel, dst=final)
+        
+        # ORB runs on the CPU, download only the final image
+        return final.get() if self.use_opencl else final
+    
     def preprocess_image(self, image_path: str) -> Optional[np.ndarray]:
         """
         Preprocess palm image for feature extraction with improved handling
         """
         try:
-            # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                logging.error(f"Failed to load image: {image_path}")
+            gray = self.load_grayscale(image_path)
+            if gray is None:
                 return None
             
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Apply bilateral filter to reduce noise while preserving edges
-            filtered = cv2.bilateralFilter(gray, 9, 75, 75)
-            
-            # Enhance contrast using adaptive histogram equalization
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(filtered)
-            
-            # Apply slight Gaussian blur for smoothing
-            smoothed = cv2.GaussianBlur(enhanced, (3, 3), 0)
-            
-            # Resize to larger standard size for better feature detection
-            resized = cv2.resize(smoothed, (640, 480))
-            
-            # Apply sharpening kernel to enhance palm lines
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            sharpened = cv2.filter2D(resized, -1, kernel)
-            
-            # Blend original and sharpened image
-            final = cv2.addWeighted(resized, 0.7, sharpened, 0.3, 0)
-            
-            return final
+            return self.preprocess_fused(gray)
             
         except Exception as e:
-            logging.error(f"Error preprocessing image {image_path}: {str(e)}")
+            logging.error("Error preprocessing image %s: %s", image_path, e)
             return None
     
     def extract_features(self, image_path: str) -> Optional[np.ndarray]:
@@ -55,24 +271,107 @@ class PalmRecognition:
         Extract ORB features from palm image
         """
         try:
-            # Preprocess image
-            processed_image = self.preprocess_image(image_path)
-            if processed_image is None:
+            gray = self.load_grayscale(image_path)
+            if gray is None:
                 return None
             
-            # Detect keypoints and compute descriptors
-            keypoints, descriptors = self.orb.detectAndCompute(processed_image, None)
+            return self.extract_features_from_gray(gray, image_path)
             
-            if descriptors is None or len(descriptors) == 0:
-                logging.warning(f"No features detected in image: {image_path}")
+        except Exception as e:
+            logging.error("Error extracting features from %s: %s", image_path, e)
+            return None
+    
+    def extract_features_from_bytes(self, image_bytes: bytes, source: str = "upload") -> Optional[np.ndarray]:
+        """
+        Extract ORB features from an uploaded palm image without touching disk
+        """
+        try:
+            gray = self.decode_grayscale(image_bytes)
+            if gray is None:
                 return None
             
-            logging.info(f"Extracted {len(descriptors)} features from {image_path}")
-            return descriptors
+            return self.extract_features_from_gray(gray, source)
             
         except Exception as e:
-            logging.error(f"Error extracting features from {image_path}: {str(e)}")
+            logging.error("Error extracting features from %s: %s", source, e)
+            return None
+    
+    def extract_features_from_gray(self, gray: np.ndarray, source: str = "image") -> Optional[np.ndarray]:
+        """
+        Extract ORB features from an already decoded grayscale palm image,
+        rejecting images too small or too flat before any preprocessing
+        """
+        # Check image dimensions
+        height, width = gray.shape[:2]
+        if height < 100 or width < 100:
+            logging.warning("Image too small for palm recognition: %s", source)
+            return None
+        
+        # Check if image has sufficient contrast
+        _, stddev = cv2.meanStdDev(gray)
+        if stddev[0, 0] < 20:  # Low standard deviation indicates low contrast
+            logging.warning("Image has insufficient contrast: %s", source)
             return None
+        
+        if self.use_gpu:
+            descriptors = self._extract_features_gpu(gray)
+        else:
+            # Preprocess image
+            processed_image = self.preprocess_fused(gray)
+            
+            # Detect keypoints and compute descriptors
+            keypoints, descriptors = self.orb.detectAndCompute(processed_image, None)
+        
+        if descriptors is None or len(descriptors) == 0:
+            logging.warning("No features detected in image: %s", source)
+            return None
+        
+        logging.debug("Extracted %d features from %s", len(descriptors), source)
+        return descriptors
+    
+    def _extract_features_gpu(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Run the preprocessing chain and ORB on CUDA, downloading only the descriptors
+        """
+        # Each request gets its own stream so concurrent enrollments overlap
+        stream = cv2.cuda_Stream()
+        gpu_gray = cv2.cuda_GpuMat()
+        gpu_gray.upload(gray, stream)
+        
+        resized = cv2.cuda.resize(gpu_gray, PALM_IMAGE_SIZE, stream=stream)
+        filtered = cv2.cuda.bilateralFilter(resized, 9, 75, 75, stream=stream)
+        enhanced = cv2.cuda.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8)).apply(filtered, stream)
+        sharpen = cv2.cuda.createLinearFilter(cv2.CV_8UC1, cv2.CV_8UC1, self.sharpen_kernel)
+        final = sharpen.apply(enhanced, stream=stream)
+        
+        orb = cv2.cuda_ORB.create(**ORB_PARAMS)
+        keypoints, gpu_descriptors = orb.detectAndComputeAsync(final, None, stream=stream)
+        stream.waitForCompletion()
+        
+        if gpu_descriptors.empty():
+            return None
+        return gpu_descriptors.download()
+    
+    def _match_distances(self, features1: np.ndarray, features2: np.ndarray) -> np.ndarray:
+        """
+        Return Hamming distances of mutual nearest-neighbour matches
+        """
+        if self.use_gpu:
+            gpu_features1 = cv2.cuda_GpuMat()
+            gpu_features1.upload(features1)
+            gpu_features2 = cv2.cuda_GpuMat()
+            gpu_features2.upload(features2)
+            
+            forward = self.gpu_matcher.match(gpu_features1, gpu_features2)
+            backward = self.gpu_matcher.match(gpu_features2, gpu_features1)
+            best_in_2 = np.array([m.trainIdx for m in forward], dtype=np.intp)
+            best_in_1 = np.array([m.trainIdx for m in backward], dtype=np.intp)
+            forward_distances = np.array([m.distance for m in forward], dtype=np.int32)
+            
+            mutual = np.flatnonzero(best_in_1[best_in_2] == np.arange(len(features1)))
+            return forward_distances[mutual]
+        
+        return mutual_match_distances(self.hamming(features1, features2))
     
     def compare_features(self, features1: np.ndarray, features2: np.ndarray) -> float:
         """
@@ -91,53 +390,63 @@ class PalmRecognition:
             if features2.dtype != np.uint8:
                 features2 = features2.astype(np.uint8)
             
-            # Match features using BFMatcher
-            matches = self.matcher.match(features1, features2)
-            
-            if len(matches) == 0:
-                return 0.0
-            
-            # Sort matches by distance (lower is better)
-            matches = sorted(matches, key=lambda x: x.distance)
-            
-            # Use more lenient distance threshold for better matching
-            good_matches = [m for m in matches if m.distance < 60]  # Increased from 50 to 60
+            # Distances of cross-checked (mutual best) matches
+            distances = self._match_distances(features1, features2)
             
-            # Use top 20% of matches for more reliable scoring
-            top_matches = matches[:max(10, len(matches) // 5)]
-            excellent_matches = [m for m in top_matches if m.distance < 45]
-            
-            # Calculate multiple similarity metrics
-            # 1. Ratio of good matches to minimum feature count
             min_features = min(len(features1), len(features2))
-            basic_score = len(good_matches) / min_features
-            
-            # 2. Quality-weighted score based on match distances
-            if len(top_matches) > 0:
-                avg_distance = sum(m.distance for m in top_matches) / len(top_matches)
-                distance_score = max(0, (80 - avg_distance) / 80)  # Normalize distance to 0-1
-            else:
-                distance_score = 0
-            
-            # 3. Excellent matches bonus
-            excellent_ratio = len(excellent_matches) / min(20, min_features)
-            
-            # Combine scores with weights
-            final_score = (basic_score * 0.4) + (distance_score * 0.4) + (excellent_ratio * 0.2)
-            
-            # Cap the score at 1.0
-            final_score = min(1.0, final_score)
-            
-            logging.info(f"Feature comparison: {len(good_matches)} good matches, {len(excellent_matches)} excellent matches out of {len(matches)} total")
-            logging.info(f"Scores - Basic: {basic_score:.3f}, Distance: {distance_score:.3f}, Excellent: {excellent_ratio:.3f}")
-            logging.info(f"Final similarity score: {final_score:.3f}")
-            
-            return final_score
+            return score_distances(distances, min_features)
             
         except Exception as e:
-            logging.error(f"Error comparing features: {str(e)}")
+            logging.error("Error comparing features: %s", e)
             return 0.0
     
+    def compare_many(self, probe: np.ndarray, gallery, gallery_lengths: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Compare one set of ORB features against many stored sets (1:N lookup)
+        and return an (M,) similarity vector.
+        
+        gallery is either a list of descriptor arrays or a padded (K, F, 32)
+        uint8 tensor together with the number of valid rows per user.
+        """
+        if gallery_lengths is None:
+            return np.array([self.compare_features(probe, stored) for stored in gallery], dtype=np.float32)
+        
+        if self.use_gpu:
+            return np.array([
+                self.compare_features(probe, stored[:length])
+                for stored, length in zip(gallery, gallery_lengths)
+            ], dtype=np.float32)
+        
+        scores = np.zeros(len(gallery), dtype=np.float32)
+        if probe is None or len(probe) == 0:
+            return scores
+        
+        probe = probe.astype(np.uint8, copy=False)
+        max_features = gallery.shape[1]
+        padding = np.arange(max_features)[None, :] >= gallery_lengths[:, None]
+        
+        for start in range(0, len(gallery), GALLERY_BLOCK_USERS):
+            block = gallery[start:start + GALLERY_BLOCK_USERS]
+            block_users = len(block)
+            
+            # One Hamming kernel pass over every descriptor in the block, shaped (N, K, F)
+            distances = self.hamming(probe, block.reshape(-1, block.shape[-1]))
+            distances = distances.reshape(len(probe), block_users, max_features)
+            distances[:, padding[start:start + block_users]] = np.iinfo(np.int32).max
+            
+            # Cross-check per user: probe -> user along F, user -> probe along N
+            best_in_user = distances.argmin(axis=2)
+            best_in_probe = distances.argmin(axis=0)
+            user_index = np.arange(block_users)
+            mutual = best_in_probe[user_index[None, :], best_in_user] == np.arange(len(probe))[:, None]
+            match_distances = np.take_along_axis(distances, best_in_user[:, :, None], axis=2)[:, :, 0]
+            
+            for k in range(block_users):
+                length = int(gallery_lengths[start + k])
+                scores[start + k] = score_distances(match_distances[mutual[:, k], k], min(len(probe), length))
+        
+        return scores
+    
     def authenticate_palm(self, test_image_path: str, stored_features: np.ndarray, threshold: float = 0.3) -> Tuple[bool, float]:
         """
         Authenticate palm against stored features
@@ -154,43 +463,36 @@ class PalmRecognition:
             # Determine if authentication is successful
             is_authenticated = similarity >= threshold
             
-            logging.info(f"Palm authentication result: {is_authenticated} (similarity: {similarity:.3f}, threshold: {threshold})")
+            logging.info("Palm authentication result: %s (similarity: %.3f, threshold: %s)",
+                         is_authenticated, similarity, threshold)
             
             return is_authenticated, similarity
             
         except Exception as e:
-            logging.error(f"Error during palm authentication: {str(e)}")
+            logging.error("Error during palm authentication: %s", e)
             return False, 0.0
     
-    def validate_palm_image(self, image_path: str) -> bool:
+    def validate_palm_image(self, image_path: str) -> Tuple[bool, Optional[np.ndarray]]:
         """
-        Validate if an image is suitable for palm recognition
+        Validate if an image is suitable for palm recognition.
+        Returns (is_valid, descriptors) so callers do not extract features twice
         """
-        try:
-            image = cv2.imread(image_path)
-            if image is None:
-                return False
-            
-            # Check image dimensions
-            height, width = image.shape[:2]
-            if height < 100 or width < 100:
-                logging.warning("Image too small for palm recognition")
-                return False
-            
-            # Check if image has sufficient contrast
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            if np.std(gray) < 20:  # Low standard deviation indicates low contrast
-                logging.warning("Image has insufficient contrast")
-                return False
-            
-            # Try to extract features to validate
-            features = self.extract_features(image_path)
-            if features is None or len(features) < 10:
-                logging.warning("Insufficient features detected in image")
-                return False
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error validating palm image: {str(e)}")
-            return False
+        # Size and contrast checks run inside extraction, before preprocessing
+        features = self.extract_features(image_path)
+        if features is None or len(features) < MIN_PALM_FEATURES:
+            logging.warning("Insufficient features detected in image")
+            return False, None
+        
+        return True, features
+    
+    def validate_palm_bytes(self, image_bytes: bytes, source: str = "upload") -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Validate an uploaded palm image held in memory.
+        Returns (is_valid, descriptors) like validate_palm_image
+        """
+        features = self.extract_features_from_bytes(image_bytes, source)
+        if features is None or len(features) < MIN_PALM_FEATURES:
+            logging.warning("Insufficient features detected in image")
+            return False, None
+        
+        return True, features
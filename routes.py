@@ -1,20 +1,79 @@
 import os
-import json
+import math
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import render_template, request, redirect, url_for, flash, session, jsonify
 from werkzeug.utils import secure_filename
 from app import app, db
 from models import User, Transaction, PalmScanLog
-from palm_recognition import PalmRecognition
 from wallet import WalletService
-import cv2
-import numpy as np
 
-palm_recognizer = PalmRecognition()
 wallet_service = WalletService()
 
+# The palm recognizer and gallery are created on first use in each worker, so
+# workers that never see a palm scan skip importing OpenCV, detector setup,
+# GPU initialisation and the gallery load (and nothing GPU-bound is created
+# before a fork)
+_palm_database = None
+_palm_lock = threading.Lock()
+
+def get_palm():
+    """
+    Return this process's palm gallery (its recognizer is get_palm().recognizer)
+    """
+    global _palm_database
+    if _palm_database is None:
+        with _palm_lock:
+            if _palm_database is None:
+                from palm_recognition import PalmRecognition
+                from palm_database import PalmDatabase
+                recognizer = PalmRecognition(use_gpu=app.config['PALM_USE_GPU'],
+                                             use_opencl=app.config['PALM_USE_OPENCL'],
+                                             use_blas=app.config['PALM_USE_BLAS'])
+                _palm_database = PalmDatabase(recognizer)
+    return _palm_database
+
+# Palm feature extraction runs on a bounded pool off the request threads. OpenCV
+# releases the GIL, so threads scale without pickling images to worker processes
+palm_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='palm')
+
+def extract_upload_features(image_bytes, source):
+    """
+    Extract palm features from uploaded image bytes on the palm worker pool
+    """
+    return palm_executor.submit(get_palm().recognizer.extract_features_from_bytes, image_bytes, source).result()
+
+def validate_upload(image_bytes, source):
+    """
+    Validate an uploaded palm image on the palm worker pool.
+    Returns (is_valid, descriptors)
+    """
+    return palm_executor.submit(get_palm().recognizer.validate_palm_bytes, image_bytes, source).result()
+
+ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif'})
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
+    _, dot, extension = filename.rpartition('.')
+    return bool(dot) and extension.lower() in ALLOWED_EXTENSIONS
+
+def form_amount():
+    """
+    Parse the posted amount, returning None unless it is a positive finite number
+    """
+    amount = request.form.get('amount', type=float)
+    if not amount or amount <= 0 or not math.isfinite(amount):
+        return None
+    return amount
+
+def load_payment_parties(sender_id, recipient_username):
+    """
+    Fetch the paying user and the recipient in one query
+    """
+    users = User.query.filter((User.id == sender_id) | (User.username == recipient_username)).all()
+    sender = next((user for user in users if user.id == sender_id), None)
+    recipient = next((user for user in users if user.username == recipient_username), None)
+    return sender, recipient
 
 @app.route('/')
 def index():
@@ -79,9 +138,7 @@ def dashboard():
         return redirect(url_for('login'))
     
     user = User.query.get(session['user_id'])
-    recent_transactions = Transaction.query.filter(
-        (Transaction.sender_id == user.id) | (Transaction.receiver_id == user.id)
-    ).order_by(Transaction.timestamp.desc()).limit(5).all()
+    recent_transactions = Transaction.for_user(user.id, limit=5)
     
     return render_template('dashboard.html', user=user, transactions=recent_transactions)
 
@@ -102,23 +159,26 @@ def register_palm():
         
         if file and allowed_file(file.filename):
             user = User.query.get(session['user_id'])
-            filename = secure_filename(f"palm_{user.id}_{file.filename}")
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            image_bytes = file.read()
             
-            # Process palm image and extract features
-            features = palm_recognizer.extract_features(filepath)
-            if features is not None:
+            # Process palm image in memory (size and contrast are checked first)
+            is_valid, features = validate_upload(image_bytes, file.filename)
+            if is_valid:
+                # Keep the original upload only once it produced a usable template
+                filename = secure_filename(f"palm_{user.id}_{file.filename}")
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                with open(filepath, 'wb') as f:
+                    f.write(image_bytes)
                 user.palm_image_path = filepath
-                user.palm_features = json.dumps(features.tolist())
+                user.set_palm_descriptors(features)
                 user.is_palm_registered = True
                 db.session.commit()
+                get_palm().enroll(user.id, features)
                 
                 flash('Palm print registered successfully!', 'success')
                 return redirect(url_for('dashboard'))
             else:
                 flash('Failed to process palm image. Please try again.', 'danger')
-                os.remove(filepath)  # Clean up failed upload
     
     return render_template('register.html')
 
@@ -131,65 +191,50 @@ def palm_login():
     if file.filename == '' or not allowed_file(file.filename):
         return jsonify({'success': False, 'message': 'Invalid image file'})
     
-    # Save temporary file
-    temp_filename = secure_filename(f"temp_{file.filename}")
-    temp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-    file.save(temp_filepath)
+    # Extract features from uploaded image, decoded in memory
+    uploaded_features = extract_upload_features(file.read(), file.filename)
+    if uploaded_features is None:
+        return jsonify({'success': False, 'message': 'Failed to process palm image'})
     
-    try:
-        # Extract features from uploaded image
-        uploaded_features = palm_recognizer.extract_features(temp_filepath)
-        if uploaded_features is None:
-            return jsonify({'success': False, 'message': 'Failed to process palm image'})
-        
-        # Find matching user
-        users = User.query.filter_by(is_palm_registered=True).all()
-        best_match = None
-        best_score = 0
-        
-        for user in users:
-            if user.palm_features:
-                stored_features = np.array(json.loads(user.palm_features))
-                similarity = palm_recognizer.compare_features(uploaded_features, stored_features)
-                
-                if similarity > best_score:
-                    best_score = similarity
-                    best_match = user
-        
-        # Log scan attempt with updated threshold
-        threshold = 0.2
-        scan_log = PalmScanLog(
-            user_id=best_match.id if best_match else None,
-            scan_result='success' if best_score > threshold else 'no_match',
-            confidence_score=best_score,
-            ip_address=request.remote_addr
-        )
-        db.session.add(scan_log)
-        db.session.commit()
-        
-        # Use adaptive threshold based on best score
-        threshold = 0.2  # Reduced from 0.3 to 0.2 for better usability
-        
-        if best_score > threshold:  # Threshold for successful match
-            session['user_id'] = best_match.id
-            session['username'] = best_match.username
-            return jsonify({
-                'success': True, 
-                'message': f'Palm authentication successful! (Confidence: {best_score:.1%})',
-                'redirect': url_for('dashboard')
-            })
-        else:
-            # Provide more helpful feedback
-            if best_score > 0.1:
-                message = f'Palm partially recognized but confidence too low ({best_score:.1%}). Please try again with better lighting.'
-            else:
-                message = 'Palm not recognized. Make sure your palm is clearly visible and try again.'
-            return jsonify({'success': False, 'message': message})
+    # Find matching user with one scan over the cached palm gallery
+    best_match = None
+    best_score = 0
+    
+    # Exact scan over every enrolled palm: an approximate shortlist could log in the wrong user
+    matches = get_palm().identify(uploaded_features, shortlist=False)
+    if matches and matches[0][1] > 0:
+        best_match_id, best_score = matches[0]
+        best_match = User.query.get(best_match_id)
+    
+    # Log scan attempt with updated threshold
+    threshold = 0.2
+    scan_log = PalmScanLog(
+        user_id=best_match.id if best_match else None,
+        scan_result='success' if best_score > threshold else 'no_match',
+        confidence_score=best_score,
+        ip_address=request.remote_addr
+    )
+    db.session.add(scan_log)
+    db.session.commit()
+    
+    # Use adaptive threshold based on best score
+    threshold = 0.2  # Reduced from 0.3 to 0.2 for better usability
     
-    finally:
-        # Clean up temporary file
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
+    if best_score > threshold:  # Threshold for successful match
+        session['user_id'] = best_match.id
+        session['username'] = best_match.username
+        return jsonify({
+            'success': True, 
+            'message': f'Palm authentication successful! (Confidence: {best_score:.1%})',
+            'redirect': url_for('dashboard')
+        })
+    else:
+        # Provide more helpful feedback
+        if best_score > 0.1:
+            message = f'Palm partially recognized but confidence too low ({best_score:.1%}). Please try again with better lighting.'
+        else:
+            message = 'Palm not recognized. Make sure your palm is clearly visible and try again.'
+        return jsonify({'success': False, 'message': message})
 
 @app.route('/deposit', methods=['GET', 'POST'])
 def deposit():
@@ -197,26 +242,19 @@ def deposit():
         return redirect(url_for('login'))
     
     if request.method == 'POST':
-        amount = float(request.form['amount'])
-        if amount <= 0:
+        amount = form_amount()
+        if amount is None:
             flash('Invalid amount', 'danger')
             return redirect(request.url)
         
         user = User.query.get(session['user_id'])
-        user.add_funds(amount)
         
-        # Create transaction record
-        transaction = Transaction(
-            receiver_id=user.id,
-            amount=amount,
-            transaction_type='deposit',
-            description=f'Wallet deposit'
-        )
-        db.session.add(transaction)
-        db.session.commit()
-        
-        flash(f'Successfully deposited ${amount:.2f}', 'success')
-        return redirect(url_for('dashboard'))
+        # Balance change and transaction record are committed together
+        if wallet_service.add_funds(user, amount, 'Wallet deposit'):
+            flash(f'Successfully deposited ${amount:.2f}', 'success')
+            return redirect(url_for('dashboard'))
+        else:
+            flash('Deposit failed', 'danger')
     
     return render_template('deposit.html')
 
@@ -227,15 +265,14 @@ def payment():
     
     if request.method == 'POST':
         recipient_username = request.form['recipient']
-        amount = float(request.form['amount'])
+        amount = form_amount()
         description = request.form.get('description', '')
         
-        if amount <= 0:
+        if amount is None:
             flash('Invalid amount', 'danger')
             return redirect(request.url)
         
-        sender = User.query.get(session['user_id'])
-        recipient = User.query.filter_by(username=recipient_username).first()
+        sender, recipient = load_payment_parties(session['user_id'], recipient_username)
         
         if not recipient:
             flash('Recipient not found', 'danger')
@@ -264,56 +301,40 @@ def palm_payment():
         return jsonify({'success': False, 'message': 'No palm image provided'})
     
     recipient_username = request.form.get('recipient')
-    amount = float(request.form.get('amount', 0))
+    amount = form_amount()
     description = request.form.get('description', '')
     
-    if amount <= 0:
+    if amount is None:
         return jsonify({'success': False, 'message': 'Invalid amount'})
     
     file = request.files['palm_image']
-    temp_filename = secure_filename(f"temp_payment_{file.filename}")
-    temp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-    file.save(temp_filepath)
-    
-    try:
-        # Authenticate user via palm scan
-        uploaded_features = palm_recognizer.extract_features(temp_filepath)
-        if uploaded_features is None:
-            return jsonify({'success': False, 'message': 'Failed to process palm image'})
-        
-        # Find authenticated user
-        authenticated_user = None
-        users = User.query.filter_by(is_palm_registered=True).all()
-        
-        for user in users:
-            if user.palm_features:
-                stored_features = np.array(json.loads(user.palm_features))
-                similarity = palm_recognizer.compare_features(uploaded_features, stored_features)
-                
-                if similarity > 0.2:  # Authentication threshold (reduced for better usability)
-                    authenticated_user = user
-                    break
-        
-        if not authenticated_user:
-            return jsonify({'success': False, 'message': 'Palm authentication failed'})
-        
-        # Find recipient
-        recipient = User.query.filter_by(username=recipient_username).first()
-        if not recipient:
-            return jsonify({'success': False, 'message': 'Recipient not found'})
-        
-        # Process payment
-        if wallet_service.transfer_funds(authenticated_user, recipient, amount, description):
-            return jsonify({
-                'success': True, 
-                'message': f'Payment of ${amount:.2f} sent to {recipient.username}'
-            })
-        else:
-            return jsonify({'success': False, 'message': 'Payment failed - insufficient funds'})
     
-    finally:
-        if os.path.exists(temp_filepath):
-            os.remove(temp_filepath)
+    # Authenticate user via palm scan, decoded in memory
+    uploaded_features = extract_upload_features(file.read(), file.filename)
+    if uploaded_features is None:
+        return jsonify({'success': False, 'message': 'Failed to process palm image'})
+    
+    # Find authenticated user: exact best match over the cached palm gallery shared with palm_login,
+    # never the approximate shortlist, so a payment cannot be charged to the wrong account
+    authenticated_user = recipient = None
+    matches = get_palm().identify(uploaded_features, shortlist=False)
+    if matches and matches[0][1] > 0.2:  # Authentication threshold (reduced for better usability)
+        authenticated_user, recipient = load_payment_parties(matches[0][0], recipient_username)
+    
+    if not authenticated_user:
+        return jsonify({'success': False, 'message': 'Palm authentication failed'})
+    
+    if not recipient:
+        return jsonify({'success': False, 'message': 'Recipient not found'})
+    
+    # Process payment
+    if wallet_service.transfer_funds(authenticated_user, recipient, amount, description):
+        return jsonify({
+            'success': True, 
+            'message': f'Payment of ${amount:.2f} sent to {recipient.username}'
+        })
+    else:
+        return jsonify({'success': False, 'message': 'Payment failed - insufficient funds'})
 
 @app.route('/set_payment_pin', methods=['GET', 'POST'])
 def set_payment_pin():
@@ -344,24 +365,28 @@ def pin_payment():
         return jsonify({'success': False, 'message': 'Not authenticated'})
     
     recipient_username = request.form.get('recipient')
-    amount = float(request.form.get('amount', 0))
+    amount = form_amount()
     description = request.form.get('description', '')
     pin = request.form.get('pin')
     
-    if amount <= 0:
+    if amount is None:
         return jsonify({'success': False, 'message': 'Invalid amount'})
     
     if not pin or len(pin) != 6:
         return jsonify({'success': False, 'message': 'Please enter a 6-digit PIN'})
     
-    sender = User.query.get(session['user_id'])
+    sender, recipient = load_payment_parties(session['user_id'], recipient_username)
     if not sender.is_pin_set:
         return jsonify({'success': False, 'message': 'Payment PIN not set. Please set your PIN first.'})
     
-    if not sender.check_payment_pin(pin):
+    if sender.is_pin_locked():
+        return jsonify({'success': False, 'message': 'Too many incorrect PIN attempts. Please try again later.'})
+    
+    is_valid = sender.check_payment_pin(pin)
+    db.session.commit()  # Persist the attempt count (and an upgraded legacy PIN hash)
+    if not is_valid:
         return jsonify({'success': False, 'message': 'Incorrect PIN. Please try again.'})
     
-    recipient = User.query.filter_by(username=recipient_username).first()
     if not recipient:
         return jsonify({'success': False, 'message': 'Recipient not found'})
     
@@ -382,9 +407,7 @@ def history():
         return redirect(url_for('login'))
     
     user = User.query.get(session['user_id'])
-    transactions = Transaction.query.filter(
-        (Transaction.sender_id == user.id) | (Transaction.receiver_id == user.id)
-    ).order_by(Transaction.timestamp.desc()).all()
+    transactions = Transaction.for_user(user.id)
     
     return render_template('history.html', transactions=transactions, current_user_id=user.id)
 
@@ -1,5 +1,6 @@
 import logging
 from datetime import datetime
+from sqlalchemy import update
 from app import db
 from models import User, Transaction
 
@@ -16,8 +17,8 @@ class WalletService:
                 self.logger.warning(f"Invalid deposit amount: {amount}")
                 return False
             
-            # Update user balance
-            user.wallet_balance += amount
+            # Update user balance in the database, not from the loaded value
+            self._credit(user.id, amount)
             
             # Create transaction record
             transaction = Transaction(
@@ -48,13 +49,12 @@ class WalletService:
                 self.logger.warning(f"Invalid deduction amount: {amount}")
                 return False
             
-            if user.wallet_balance < amount:
-                self.logger.warning(f"Insufficient funds: user {user.username} has ${user.wallet_balance:.2f}, needs ${amount:.2f}")
+            # Update user balance, only if it covers the amount at this moment
+            if not self._debit(user.id, amount):
+                self.logger.warning(f"Insufficient funds: user {user.username} needs ${amount:.2f}")
+                db.session.rollback()
                 return False
             
-            # Update user balance
-            user.wallet_balance -= amount
-            
             # Create transaction record
             transaction = Transaction(
                 sender_id=user.id,
@@ -85,17 +85,23 @@ class WalletService:
                 self.logger.warning(f"Invalid transfer amount: {amount}")
                 return False
             
-            if sender.wallet_balance < amount:
-                self.logger.warning(f"Insufficient funds: sender {sender.username} has ${sender.wallet_balance:.2f}, needs ${amount:.2f}")
-                return False
-            
             if sender.id == receiver.id:
                 self.logger.warning("Cannot transfer funds to self")
                 return False
             
-            # Update balances
-            sender.wallet_balance -= amount
-            receiver.wallet_balance += amount
+            # Update balances with conditional UPDATEs, so concurrent payments cannot
+            # overdraw or lose updates; rows are locked in id order to avoid deadlocks
+            if sender.id < receiver.id:
+                debited = self._debit(sender.id, amount)
+                self._credit(receiver.id, amount)
+            else:
+                self._credit(receiver.id, amount)
+                debited = self._debit(sender.id, amount)
+            
+            if not debited:
+                self.logger.warning(f"Insufficient funds: sender {sender.username} needs ${amount:.2f}")
+                db.session.rollback()
+                return False
             
             # Create transaction record
             transaction = Transaction(
@@ -118,14 +124,38 @@ class WalletService:
             db.session.rollback()
             return False
     
+    def _debit(self, user_id: int, amount: float) -> bool:
+        """
+        Atomically subtract amount from a balance that covers it.
+        Returns False when the balance is too low
+        """
+        result = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.wallet_balance >= amount)
+            .values(wallet_balance=User.wallet_balance - amount)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+    
+    def _credit(self, user_id: int, amount: float):
+        """
+        Atomically add amount to a balance
+        """
+        db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(wallet_balance=User.wallet_balance + amount)
+            .execution_options(synchronize_session=False)
+        )
+    
     def get_balance(self, user: User) -> float:
         """
         Get user's current wallet balance
         """
         try:
-            # Refresh user data from database
-            db.session.refresh(user)
-            return user.wallet_balance
+            # Read just the balance column instead of refreshing the whole row (palm template included)
+            balance = db.session.query(User.wallet_balance).filter(User.id == user.id).scalar()
+            return float(balance or 0.0)
         except Exception as e:
             self.logger.error(f"Error getting balance for user {user.username}: {str(e)}")
             return 0.0
@@ -135,11 +165,7 @@ class WalletService:
         Get user's transaction history
         """
         try:
-            transactions = Transaction.query.filter(
-                (Transaction.sender_id == user.id) | (Transaction.receiver_id == user.id)
-            ).order_by(Transaction.timestamp.desc()).limit(limit).all()
-            
-            return transactions
+            return Transaction.for_user(user.id, limit=limit)
         except Exception as e:
             self.logger.error(f"Error getting transaction history for user {user.username}: {str(e)}")
             return []
@@ -197,9 +223,12 @@ class WalletService:
                 self.logger.error(f"User not found for transaction {transaction_id}")
                 return False
             
-            # Reverse the transaction
-            receiver.wallet_balance -= transaction.amount
-            sender.wallet_balance += transaction.amount
+            # Reverse the transaction, only if the receiver still holds the amount
+            if not self._debit(receiver.id, transaction.amount):
+                self.logger.warning(f"Insufficient funds: user {receiver.username} cannot refund ${transaction.amount:.2f}")
+                db.session.rollback()
+                return False
+            self._credit(sender.id, transaction.amount)
             
             # Create refund transaction record
             refund_transaction = Transaction(